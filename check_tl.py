@@ -1,9 +1,20 @@
 import sqlite3
 import logging
+import queue
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from itertools import islice
 from typing import Optional
-from xrpl.clients import JsonRpcClient
-from xrpl.models.requests import AccountLines
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson  # optional: faster JSON parsing of node responses
+except ImportError:
+    orjson = None
 
 # ---------------------------------------------------------------------
 # Configuration
@@ -12,6 +23,11 @@ DB_PATH = "snapshot.db"
 AIRDROP_TABLE = "tokens"
 MISSING_TL_TABLE = "tokens_missing_tl"
 RETRY_QUEUE_TABLE = "retry_queue"  # We'll create a separate table for Wallets we can't confirm
+CONFIRMED_TL_TABLE = "confirmed_tl"  # Wallets seen with the trustline (per token); skipped on later runs
+TL_CACHE_TABLE = "tl_cache"  # Wallets recently seen WITHOUT the trustline, saved for re-runs
+
+# How old (in ledgers, ~4s each) a cached "no trustline" answer may be and still be reused
+TL_CACHE_MAX_AGE_LEDGERS = 900
 
 # Multiple nodes for failover:
 NODES = [
@@ -23,16 +39,105 @@ NODES = [
 ISSUER_OF_TOKEN = "rJ9uU9jKxNcsNQM2CLKUhPxNn8P4xmhDVq"
 CURRENCY_HEX = "4241594E414E4100000000000000000000000000"
 
+# Concurrency / rate-limiting
+CONCURRENCY = 8  # how many Wallets are checked in parallel
+REQUESTS_PER_SECOND_PER_NODE = 10  # average request rate allowed against each node
+NODE_BURST = 10  # how many requests a node may receive back-to-back
+MAX_NODE_BACKOFF_SECONDS = 60  # longest pause after a node asks us to slow down
+MAX_IN_FLIGHT = 64  # Wallets handed to the workers ahead of their results
+WRITE_BATCH_SIZE = 500  # max moves the writer thread commits per transaction...
+WRITE_FLUSH_SECONDS = 0.2  # ...or whatever it has collected after this long
+
+# account_lines page size (rippled accepts 10-400); larger pages mean fewer round-trips
+ACCOUNT_LINES_PAGE_LIMIT = 400
+# Most marker pages we follow for one Wallet before giving up on that node
+MAX_ACCOUNT_LINES_PAGES = 50
+
+# rippled error codes meaning "you are sending too much", not "bad request"
+RATE_LIMIT_ERRORS = {"slowDown", "tooBusy"}
+# rippled error codes meaning the Wallet can't hold a trustline at all: a final "no"
+NO_ACCOUNT_ERRORS = {"actNotFound", "actMalformed"}
+# rippled error codes that asking the same node again won't fix (try the next node instead)
+PERMANENT_NODE_ERRORS = {"invalidParams", "unknownCmd", "noPermission", "forbidden", "notImpl",
+                         "tooManyPages"}
+# rippled error code some versions return for a marker combined with `peer`
+PEER_MARKER_ERROR = "invalidParams"
+
+# HTTP statuses worth retrying on the same node; any other status means this
+# node refuses the request (bad request, WAF block, wrong URL...)
+RETRYABLE_HTTP_STATUSES = {408, 429, 500, 502, 503, 504}
+RATE_LIMIT_HTTP_STATUSES = {429, 503}
+
+REQUEST_TIMEOUT_SECONDS = 10  # per HTTP request to a node
+
 # Logging setup
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
 
 
+# SQLite tuning applied to every connection: WAL lets readers run alongside the
+# writer, and synchronous=NORMAL skips the per-commit fsync (safe under WAL)
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",      # 64 MiB page cache
+    "PRAGMA mmap_size=268435456",    # 256 MiB memory-mapped I/O
+    "PRAGMA busy_timeout=5000",      # wait up to 5s for a lock instead of failing
+]
+
+# SQL for moving Wallets between tables, prepared once and batched by DBWriter
+INSERT_MISSING_SQL = f"""
+    INSERT INTO {MISSING_TL_TABLE} (Wallet, Balance)
+    VALUES (?, ?)
+    ON CONFLICT(Wallet) DO UPDATE SET Balance = excluded.Balance
+"""
+INSERT_RETRY_SQL = f"""
+    INSERT INTO {RETRY_QUEUE_TABLE} (Wallet, Balance, tries)
+    VALUES (?, ?, 0)
+    ON CONFLICT(Wallet) DO UPDATE SET Balance = excluded.Balance  -- keeps existing tries
+"""
+INSERT_CONFIRMED_SQL = f"""
+    INSERT OR IGNORE INTO {CONFIRMED_TL_TABLE} (Wallet, issuer, currency)
+    VALUES (?, ?, ?)
+"""
+SELECT_CONFIRMED_SQL = f"""
+    SELECT Wallet FROM {CONFIRMED_TL_TABLE}
+    WHERE issuer = ? AND currency = ?
+"""
+INSERT_TL_CACHE_SQL = f"""
+    INSERT OR IGNORE INTO {TL_CACHE_TABLE} (Wallet, issuer, currency, ledger)
+    VALUES (?, ?, ?, ?)
+"""
+SELECT_TL_CACHE_SQL = f"""
+    SELECT 1 FROM {TL_CACHE_TABLE}
+    WHERE Wallet = ? AND issuer = ? AND currency = ? AND ledger >= ?
+    LIMIT 1
+"""
+PRUNE_TL_CACHE_SQL = f"DELETE FROM {TL_CACHE_TABLE} WHERE ledger < ?"
+DELETE_WALLET_SQL = "DELETE FROM {table} WHERE Wallet = ?"
+
+
 # ---------------------------------------------------------------------
 # Schema Setup
 # ---------------------------------------------------------------------
+def connect_db(db_path: str = DB_PATH, read_only: bool = False):
+    """
+    Opens a SQLite connection in autocommit mode with SQLITE_PRAGMAS applied.
+    Transactions are started explicitly with BEGIN where needed.
+    """
+    if read_only:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True,
+                               isolation_level=None, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
 def ensure_tables(conn):
     """
-    Ensures that the missing_tl and retry_queue tables exist.
+    Ensures that the missing_tl, retry_queue, confirmed_tl and tl_cache tables exist.
     """
     cursor = conn.cursor()
     
@@ -44,7 +149,7 @@ def ensure_tables(conn):
         )
     """)
     
-    # retry_queue
+    # retry_queue (the Wallet PRIMARY KEY doubles as the lookup index)
     cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS {RETRY_QUEUE_TABLE} (
             Wallet TEXT PRIMARY KEY,
@@ -53,17 +158,429 @@ def ensure_tables(conn):
         )
     """)
 
+    # confirmed_tl: keyed by token too, so changing ISSUER_OF_TOKEN / CURRENCY_HEX
+    # never reuses confirmations made for another token
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CONFIRMED_TL_TABLE} (
+            Wallet TEXT NOT NULL,
+            issuer TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            PRIMARY KEY (Wallet, issuer, currency)
+        )
+    """)
+
+    # tl_cache: one row per Wallet per token per run's validated ledger in which
+    # the Wallet had no trustline (Wallets that have it are in confirmed_tl)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TL_CACHE_TABLE} (
+            Wallet TEXT NOT NULL,
+            issuer TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            ledger INTEGER NOT NULL,
+            PRIMARY KEY (Wallet, issuer, currency, ledger)
+        )
+    """)
+
     conn.commit()
 
 
+# ---------------------------------------------------------------------
+# Single writer / multi reader DB access
+# ---------------------------------------------------------------------
+class ReaderPool:
+    """
+    Fixed pool of read-only connections. Any thread can borrow one for a
+    query; under WAL these never block (or get blocked by) the writer.
+    """
+
+    def __init__(self, db_path: str, size: int):
+        self._conns = queue.Queue()
+        for _ in range(size):
+            self._conns.put(connect_db(db_path, read_only=True))
+        self._size = size
+
+    @contextmanager
+    def connection(self):
+        conn = self._conns.get()
+        try:
+            yield conn
+        finally:
+            self._conns.put(conn)
+
+    def close(self):
+        for _ in range(self._size):
+            self._conns.get().close()
+
+
+class DBWriter:
+    """
+    Owns the only writable connection and applies all DB mutations on one
+    background thread.
+
+    Callers `submit()` a group of (sql, params) statements that belong
+    together; the thread commits whatever has queued up every
+    WRITE_FLUSH_SECONDS or WRITE_BATCH_SIZE groups, whichever comes first,
+    in one transaction with a single executemany per distinct statement.
+
+    After a failed commit the writer stops: later batches are discarded and
+    `submit()`, `flush()` and `close()` re-raise the error, so callers don't
+    keep working against a broken write path.
+    """
+
+    _STOP = object()
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, *statements):
+        """
+        Queues (sql, params) statements to be committed in the same transaction.
+        Raises the writer's error if an earlier commit failed.
+        """
+        if self._error is not None:
+            raise self._error
+        self._queue.put(statements)
+
+    def flush(self):
+        """
+        Blocks until everything submitted so far has been committed.
+        """
+        self._queue.join()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._conn.close()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is self._STOP:
+                self._queue.task_done()
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + WRITE_FLUSH_SECONDS
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._commit(batch)
+
+    def _commit(self, batch):
+        if self._error is not None:
+            # An earlier batch failed; don't commit anything queued after it
+            for _ in batch:
+                self._queue.task_done()
+            return
+
+        # Group params per statement in first-seen order. Reordering is safe:
+        # within a batch the statements touch different tables (or, for
+        # tl_cache, different ledgers), so no statement depends on another.
+        params_by_sql = {}
+        for group in batch:
+            for sql, params in group:
+                params_by_sql.setdefault(sql, []).append(params)
+
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            for sql, params_list in params_by_sql.items():
+                cursor.executemany(sql, params_list)
+            self._conn.commit()
+        except Exception as e:
+            logging.error("DB writer failed to commit a batch of %d groups: %s", len(batch), e)
+            if self._conn.in_transaction:
+                self._conn.rollback()
+            self._error = e
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+
+class TrustlineCache:
+    """
+    On-disk cache of "no trustline" answers, keyed by (Wallet, issuer, currency, ledger).
+
+    Only negative answers are stored: a Wallet found WITH the trustline is
+    recorded in confirmed_tl and filtered out of later runs before the cache
+    is ever asked. `ledger` is the validated ledger index at the start of the
+    run. Lookups accept any entry for the configured ISSUER_OF_TOKEN /
+    CURRENCY_HEX at most TL_CACHE_MAX_AGE_LEDGERS older than the current run's
+    ledger, so quick re-runs need no requests at all; older rows are pruned on
+    startup. Reads use the reader pool and writes go through the DB writer, so
+    workers can call `get`/`put_missing` directly.
+    """
+
+    def __init__(self, readers, writer, ledger_index: int):
+        self._readers = readers
+        self._writer = writer
+        self.ledger_index = ledger_index
+        self._min_ledger = ledger_index - TL_CACHE_MAX_AGE_LEDGERS
+        self._writer.submit((PRUNE_TL_CACHE_SQL, (self._min_ledger,)))
+
+    def get(self, Wallet: str) -> Optional[bool]:
+        """False if `Wallet` was recently seen without the trustline, else None."""
+        with self._readers.connection() as read_conn:
+            row = read_conn.execute(
+                SELECT_TL_CACHE_SQL, (Wallet, ISSUER_OF_TOKEN, CURRENCY_HEX, self._min_ledger)
+            ).fetchone()
+        return None if row is None else False
+
+    def put_missing(self, Wallet: str):
+        self._writer.submit((INSERT_TL_CACHE_SQL, (
+            Wallet, ISSUER_OF_TOKEN, CURRENCY_HEX, self.ledger_index
+        )))
+
+
+# ---------------------------------------------------------------------
+# Rate limiting
+# ---------------------------------------------------------------------
+class TokenBucket:
+    """
+    Thread-safe token bucket for one node: allows `rate_per_sec` requests per
+    second on average, with bursts of up to `burst`.
+
+    When the node tells us to slow down, `penalize()` pauses the bucket with an
+    exponentially growing delay; `reset_backoff()` clears it after a success.
+    """
+
+    def __init__(self, rate_per_sec: float, burst: int):
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._backoff_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a token is available (and the bucket is not paused), then takes it.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = max(0.0, now - self._updated)
+                self._tokens = min(self.burst, self._tokens + elapsed * self.rate_per_sec)
+                self._updated = max(now, self._updated)
+
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                delay = max(self._paused_until - now, (1 - self._tokens) / self.rate_per_sec)
+            time.sleep(delay)
+
+    def penalize(self, retry_after: Optional[float] = None):
+        """
+        Pauses this bucket after a rate-limit response, doubling the pause each
+        time, or for `retry_after` seconds if the node said how long to wait.
+        """
+        with self._lock:
+            self._backoff_seconds = min(max(self._backoff_seconds * 2, 1.0), MAX_NODE_BACKOFF_SECONDS)
+            pause = self._backoff_seconds if retry_after is None else min(retry_after, MAX_NODE_BACKOFF_SECONDS)
+            self._paused_until = time.monotonic() + pause
+            # No refill while paused
+            self._tokens = 0.0
+            self._updated = self._paused_until
+
+    def reset_backoff(self):
+        with self._lock:
+            self._backoff_seconds = 0.0
+
+
+# One bucket per node, so a slow or overloaded node only throttles itself
+BUCKETS = {node_url: TokenBucket(REQUESTS_PER_SECOND_PER_NODE, NODE_BURST) for node_url in NODES}
+
+
+# ---------------------------------------------------------------------
+# XRPL JSON-RPC
+# ---------------------------------------------------------------------
+class NodeError(Exception):
+    """
+    A node answered with a rippled error code (in `error`) instead of a result.
+    """
+
+    def __init__(self, error: Optional[str]):
+        super().__init__(error)
+        self.error = error
+
+
+def retry_after_seconds(response) -> Optional[float]:
+    """
+    The delay requested by a Retry-After header, if it is given in seconds.
+    """
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def make_session() -> requests.Session:
+    """
+    Builds the HTTP session shared by all worker threads. Connections to each
+    node are kept alive and pooled, so the TCP/TLS handshake is paid once per
+    connection instead of once per request.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=len(NODES),
+        pool_maxsize=max(CONCURRENCY, NODE_BURST),
+        max_retries=0,  # retries and failover are handled by fetch_trustlines_with_failover
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+SESSION = make_session()
+
+
+def rpc_call(node_url: str, method: str, params: dict) -> dict:
+    """
+    Sends one raw JSON-RPC call to `node_url` and returns its `result` object
+    (which carries `status` plus either the payload or `error`).
+    Raises on transport errors and non-2xx HTTP statuses.
+    """
+    response = SESSION.post(
+        node_url,
+        json={"method": method, "params": [params]},
+        timeout=REQUEST_TIMEOUT_SECONDS,
+    )
+    response.raise_for_status()
+
+    body = orjson.loads(response.content) if orjson is not None else response.json()
+    return body["result"]
+
+
+def account_lines(node_url: str, Wallet: str, peer: Optional[str] = None,
+                  marker=None, ledger_index="validated") -> dict:
+    """
+    One page of `account_lines` for `Wallet` as of `ledger_index`
+    (the latest validated ledger by default).
+    """
+    params = {
+        "account": Wallet,
+        "ledger_index": ledger_index,
+        "limit": ACCOUNT_LINES_PAGE_LIMIT,
+    }
+    if peer is not None:
+        params["peer"] = peer
+    if marker is not None:
+        params["marker"] = marker
+
+    return rpc_call(node_url, "account_lines", params)
+
+
+def fetch_validated_ledger_index() -> Optional[int]:
+    """
+    Asks the nodes (in order) for the current validated ledger index.
+    Returns None if none of them answer.
+    """
+    for node_url in NODES:
+        try:
+            BUCKETS[node_url].acquire()
+            result = rpc_call(node_url, "ledger", {"ledger_index": "validated"})
+            if result.get("status") == "success":
+                return int(result["ledger_index"])
+        except Exception as e:
+            logging.warning("Could not get validated ledger from %s: %s", node_url, e)
+    return None
+
+
 # ---------------------------------------------------------------------
 # XRPL Trustline Fetcher with Failover + Retries
 # ---------------------------------------------------------------------
+def contains_target_line(lines: list, _issuer=ISSUER_OF_TOKEN, _currency=CURRENCY_HEX) -> bool:
+    """
+    True if `lines` contains the ISSUER_OF_TOKEN / CURRENCY_HEX trustline.
+
+    The constants are bound as default arguments so the loop reads fast
+    locals instead of module globals. rippled always includes both keys,
+    so index directly.
+    """
+    return any(line["account"] == _issuer and line["currency"] == _currency for line in lines)
+
+
+def fetch_lines_from_node(node_url: str, bucket, Wallet: str) -> list:
+    """
+    Fetches trustlines for `Wallet` from a single node, following `marker`
+    pages until the last page or until the target trustline turns up.
+
+    The query is filtered by `peer` so rippled only returns lines with our
+    issuer; a filtered page may still come back empty with a marker, which
+    just means "keep paging". Some rippled versions reject a marker combined
+    with `peer` (PEER_MARKER_ERROR), in which case we start over without the
+    filter. Every page after the first asks for the ledger the first page
+    was read from, so a marker is never replayed against a newer ledger.
+
+    Returns the lines collected so far (ending with the target line if
+    found), or an empty list if the account doesn't exist or is malformed.
+    Raises NodeError for any other rippled error, or "tooManyPages" after
+    MAX_ACCOUNT_LINES_PAGES pages.
+    """
+    peer = ISSUER_OF_TOKEN
+    marker = None
+    ledger_index = "validated"
+    lines = []
+
+    for _ in range(MAX_ACCOUNT_LINES_PAGES):
+        bucket.acquire()
+        result = account_lines(node_url, Wallet, peer=peer, marker=marker, ledger_index=ledger_index)
+
+        if result.get("status") != "success":
+            error = result.get("error")
+            if error in NO_ACCOUNT_ERRORS:
+                # No such account => no trustline; asking again won't change that
+                logging.info("[%s] Node reports %s, treating as no trustlines.", Wallet, error)
+                return []
+            if peer is not None and marker is not None and error == PEER_MARKER_ERROR:
+                logging.info("[%s] Node rejected marker with peer (%s), paging without peer.", Wallet, error)
+                peer, marker, lines = None, None, []
+                continue
+            raise NodeError(error)
+
+        page = result.get("lines", [])
+        lines.extend(page)
+        marker = result.get("marker")
+        ledger_index = result.get("ledger_index", ledger_index)
+
+        if not marker or contains_target_line(page):
+            return lines
+
+    logging.warning("[%s] Still paging after %d pages at %s, giving up on this node.",
+                    Wallet, MAX_ACCOUNT_LINES_PAGES, node_url)
+    raise NodeError("tooManyPages")
+
+
 def fetch_trustlines_with_failover(Wallet: str) -> Optional[list]:
     """
     Attempts to fetch trustlines for `Wallet` using multiple nodes (NODES).
     Each node is tried up to 'max_retries_per_node' times with exponential backoff.
 
+    Only retryable failures (rate limits, 5xx, timeouts, connection errors)
+    are retried on the same node. A non-retryable HTTP status (e.g. 400/403/404)
+    or a PERMANENT_NODE_ERRORS code means this node won't serve the request,
+    so we move straight on to the next node without sleeping. When a node
+    rate limits us, its token bucket does the waiting instead of the fixed backoff.
+
     Returns:
         - A list of trustlines if successful.
         - None if ALL nodes fail (i.e., we cannot fetch trustlines at all).
@@ -72,51 +589,79 @@ def fetch_trustlines_with_failover(Wallet: str) -> Optional[list]:
     max_retries_per_node = 2
     base_backoff_seconds = 2
 
-    req = AccountLines(account=Wallet, ledger_index="validated")
-
     for node_url in NODES:
-        client = JsonRpcClient(node_url)
-        logging.info(f"[{Wallet}] Trying node: {node_url}")
+        bucket = BUCKETS[node_url]
+        logging.debug("[%s] Trying node: %s", Wallet, node_url)
 
         # Retry loop for the current node
         for attempt in range(1, max_retries_per_node + 1):
+            rate_limited = False
             try:
-                response = client.request(req)
-                
-                if response.is_successful():
-                    lines = response.result.get("lines", [])
-                    return lines  # Return immediately if successful
-                else:
-                    logging.warning(
-                        f"[{Wallet}] Attempt {attempt}/{max_retries_per_node} at {node_url} "
-                        "not successful. Retrying..."
-                    )
+                lines = fetch_lines_from_node(node_url, bucket, Wallet)
+                bucket.reset_backoff()
+                return lines  # Return immediately if successful
+            except NodeError as e:
+                if e.error in PERMANENT_NODE_ERRORS:
+                    logging.error("[%s] %s answered %s, which is not retryable. Skipping this node.",
+                                  Wallet, node_url, e.error)
+                    break
+                if e.error in RATE_LIMIT_ERRORS:
+                    # The node is overloaded: back off on this node only
+                    bucket.penalize()
+                    rate_limited = True
+                logging.warning(
+                    "[%s] Attempt %d/%d at %s not successful (%s). Retrying...",
+                    Wallet, attempt, max_retries_per_node, node_url, e.error
+                )
+            except requests.HTTPError as e:
+                status = e.response.status_code
+                if status not in RETRYABLE_HTTP_STATUSES:
+                    logging.error("[%s] %s answered HTTP %d, which is not retryable. Skipping this node.",
+                                  Wallet, node_url, status)
+                    break
+                if status in RATE_LIMIT_HTTP_STATUSES:
+                    bucket.penalize(retry_after_seconds(e.response))
+                    rate_limited = True
+                logging.error(
+                    "[%s] Attempt %d/%d at %s answered HTTP %d -- Retrying...",
+                    Wallet, attempt, max_retries_per_node, node_url, status
+                )
             except Exception as e:
                 logging.error(
-                    f"[{Wallet}] Attempt {attempt}/{max_retries_per_node} at {node_url} "
-                    f"raised an exception: {e} -- Retrying..."
+                    "[%s] Attempt %d/%d at %s raised an exception: %s -- Retrying...",
+                    Wallet, attempt, max_retries_per_node, node_url, e
                 )
             
-            # Exponential backoff before next attempt on the same node
-            time.sleep(base_backoff_seconds * attempt)
+            # Exponential backoff before next attempt on the same node; when rate
+            # limited, the bucket already holds the next request back
+            if attempt < max_retries_per_node and not rate_limited:
+                time.sleep(base_backoff_seconds * attempt)
 
-        # If we reach here, we have exhausted all attempts on this node
-        logging.warning(f"[{Wallet}] Node {node_url} failed all {max_retries_per_node} attempts. Trying next node...")
+        else:
+            # If we reach here, we have exhausted all attempts on this node
+            logging.warning("[%s] Node %s failed all %d attempts. Trying next node...",
+                            Wallet, node_url, max_retries_per_node)
 
     # If we exhaust all nodes, we return None => can't fetch trustlines
-    logging.error(f"[{Wallet}] All nodes failed to return trustlines.")
+    logging.error("[%s] All nodes failed to return trustlines.", Wallet)
     return None
 
 
-def has_trustline(Wallet: str) -> Optional[bool]:
+def has_trustline(Wallet: str, cache: Optional[TrustlineCache] = None) -> Optional[bool]:
     """
-    Fetches trustlines for the given Wallet using multiple nodes + retries.
+    Fetches trustlines for the given Wallet using multiple nodes + retries,
+    or from `cache` if it holds a recent enough answer.
     
     Returns:
         True  => The trustline (ISSUER_OF_TOKEN / CURRENCY_HEX) definitely exists
         False => The trustline definitely does NOT exist
         None  => Could not determine (all node requests failed)
     """
+    if cache is not None:
+        cached = cache.get(Wallet)
+        if cached is not None:
+            return cached
+
     lines = fetch_trustlines_with_failover(Wallet)
     
     if lines is None:
@@ -124,106 +669,142 @@ def has_trustline(Wallet: str) -> Optional[bool]:
         return None
 
     # If we got lines, check whether our currency & issuer are present
-    for line in lines:
-        if (line.get("account") == ISSUER_OF_TOKEN and
-                line.get("currency") == CURRENCY_HEX):
-            return True
-    return False
+    tl_status = contains_target_line(lines)
+    if cache is not None and not tl_status:
+        # True answers go to confirmed_tl with the move, so only cache the "no"
+        cache.put_missing(Wallet)
+    return tl_status
 
 
 # ---------------------------------------------------------------------
 # Processing logic
 # ---------------------------------------------------------------------
-def process_Wallets_table(conn, table_name: str, second_pass=False):
+def check_trustlines(rows, cache: Optional[TrustlineCache] = None):
+    """
+    Runs `has_trustline` for every (Wallet, Balance) in `rows` on a pool of
+    CONCURRENCY worker threads. `rows` can be a live cursor: at most
+    MAX_IN_FLIGHT Wallets are pulled from it ahead of the results, so memory
+    stays flat however big the table is.
+
+    As soon as any Wallet finishes, the next one is submitted, so one slow
+    Wallet never leaves the other workers idle.
+
+    Yields (Wallet, Balance, tl_status) in completion order. All DB work is
+    left to the caller, which stays on the main thread.
+    """
+    rows = iter(rows)
+    in_flight = {}
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        def submit(row_batch):
+            for (Wallet, Balance) in row_batch:
+                in_flight[executor.submit(has_trustline, Wallet, cache)] = (Wallet, Balance)
+
+        submit(islice(rows, MAX_IN_FLIGHT))
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            # Top the window back up before handing results to the caller
+            submit(islice(rows, len(done)))
+
+            for future in done:
+                Wallet, Balance = in_flight.pop(future)
+                yield Wallet, Balance, future.result()
+
+
+def load_confirmed_wallets(readers) -> set:
+    """
+    Returns the set of Wallets already confirmed to have the configured
+    ISSUER_OF_TOKEN / CURRENCY_HEX trustline on an earlier run, so they can
+    be skipped without another request.
+    """
+    with readers.connection() as read_conn:
+        rows = read_conn.execute(SELECT_CONFIRMED_SQL, (ISSUER_OF_TOKEN, CURRENCY_HEX))
+        return {Wallet for (Wallet,) in rows}
+
+
+def process_Wallets_table(writer, readers, table_name: str, second_pass=False, cache=None):
     """
-    1) Reads (Wallet, Balance) from `table_name`.
+    1) Reads (Wallet, Balance) from `table_name`, skipping Wallets in confirmed_tl.
     2) For each Wallet:
        - Check trustline (with fallback & retries).
-       - If `True`, do nothing (they have the trustline).
+       - If `True`, record them in confirmed_tl (they have the trustline).
        - If `False`, move them to missing_tl and remove them from `table_name`.
        - If `None`, means can't determine => if second_pass, treat as no trustline,
          otherwise move them to `retry_queue`.
     3) Returns how many Wallets were moved to missing_tl or retry_queue.
+
+    Rows are streamed through a pooled read connection while the moves are
+    handed to `writer`; everything is committed before this returns.
     """
-    cursor = conn.cursor()
-    rows = cursor.execute(f"SELECT Wallet, Balance FROM {table_name}").fetchall()
+    confirmed = load_confirmed_wallets(readers)
+    if confirmed:
+        logging.info("Skipping %d Wallets already confirmed in %s.", len(confirmed), CONFIRMED_TL_TABLE)
+
+    delete_sql = DELETE_WALLET_SQL.format(table=table_name)
 
     Wallets_moved_missing = 0
     Wallets_moved_retry = 0
 
-    for (Wallet, Balance) in rows:
-        tl_status = has_trustline(Wallet)
-        time.sleep(0.2)  # Short delay to avoid rapid-fire requests (helps with rate-limiting)
-
-        if tl_status is True:
-            # The Wallet definitely has the trustline, so do nothing
-            continue
+    with readers.connection() as read_conn:
+        rows = (
+            (Wallet, Balance)
+            for (Wallet, Balance) in read_conn.execute(f"SELECT Wallet, Balance FROM {table_name}")
+            if Wallet not in confirmed
+        )
 
-        elif tl_status is False:
-            # Definitely no trustline. Move to missing_tl
-            logging.info(f"[{Wallet}] No trustline found. Moving to {MISSING_TL_TABLE}.")
-            cursor.execute(f"""
-                INSERT OR REPLACE INTO {MISSING_TL_TABLE} (Wallet, Balance)
-                VALUES (?, ?)
-            """, (Wallet, Balance))
-            cursor.execute(f"DELETE FROM {table_name} WHERE Wallet = ?", (Wallet,))
-            Wallets_moved_missing += 1
+        for (Wallet, Balance, tl_status) in check_trustlines(rows, cache):
+            if tl_status is True:
+                # The Wallet definitely has the trustline, so leave it where it is
+                writer.submit((INSERT_CONFIRMED_SQL, (Wallet, ISSUER_OF_TOKEN, CURRENCY_HEX)))
 
-        else:
-            # tl_status is None => we couldn't determine (all requests failed)
-            if second_pass:
-                # On second pass, if we STILL can't fetch, treat as no trustline
-                logging.info(f"[{Wallet}] Could not confirm trustline on second pass. Moving to {MISSING_TL_TABLE}.")
-                cursor.execute(f"""
-                    INSERT OR REPLACE INTO {MISSING_TL_TABLE} (Wallet, Balance)
-                    VALUES (?, ?)
-                """, (Wallet, Balance))
-                cursor.execute(f"DELETE FROM {table_name} WHERE Wallet = ?", (Wallet,))
+            elif tl_status is False:
+                # Definitely no trustline. Move to missing_tl
+                logging.info("[%s] No trustline found. Moving to %s.", Wallet, MISSING_TL_TABLE)
+                writer.submit((INSERT_MISSING_SQL, (Wallet, Balance)), (delete_sql, (Wallet,)))
                 Wallets_moved_missing += 1
+
             else:
-                # Not second pass => place in retry_queue
-                logging.warning(f"[{Wallet}] Could not fetch trustlines, adding to {RETRY_QUEUE_TABLE}.")
-                cursor.execute(f"""
-                    INSERT OR REPLACE INTO {RETRY_QUEUE_TABLE} (Wallet, Balance, tries)
-                    VALUES (?, ?, COALESCE((SELECT tries FROM {RETRY_QUEUE_TABLE} WHERE Wallet=?), 0))
-                """, (Wallet, Balance, Wallet))
-                cursor.execute(f"DELETE FROM {table_name} WHERE Wallet = ?", (Wallet,))
-                Wallets_moved_retry += 1
+                # tl_status is None => we couldn't determine (all requests failed)
+                if second_pass:
+                    # On second pass, if we STILL can't fetch, treat as no trustline
+                    logging.info("[%s] Could not confirm trustline on second pass. Moving to %s.", Wallet, MISSING_TL_TABLE)
+                    writer.submit((INSERT_MISSING_SQL, (Wallet, Balance)), (delete_sql, (Wallet,)))
+                    Wallets_moved_missing += 1
+                else:
+                    # Not second pass => place in retry_queue
+                    logging.warning("[%s] Could not fetch trustlines, adding to %s.", Wallet, RETRY_QUEUE_TABLE)
+                    writer.submit((INSERT_RETRY_SQL, (Wallet, Balance)), (delete_sql, (Wallet,)))
+                    Wallets_moved_retry += 1
 
-    conn.commit()
+    writer.flush()
     return Wallets_moved_missing, Wallets_moved_retry
 
 
-def process_retry_queue(conn):
+def process_retry_queue(writer, readers, cache=None):
     """
     Process the Wallets in retry_queue exactly once more (second pass).
     If still no success, move them to missing_tl.
     """
-    cursor = conn.cursor()
-    rows = cursor.execute(f"SELECT Wallet, Balance, tries FROM {RETRY_QUEUE_TABLE}").fetchall()
+    delete_sql = DELETE_WALLET_SQL.format(table=RETRY_QUEUE_TABLE)
 
     Wallets_moved_missing = 0
 
-    for (Wallet, Balance, tries) in rows:
-        tl_status = has_trustline(Wallet)
-        time.sleep(0.2)  # short delay to help avoid rate-limiting
-
-        if tl_status is True:
-            # Now we see the trustline! Just remove from retry_queue.
-            logging.info(f"[{Wallet}] Found trustline on retry pass. Removing from retry_queue.")
-            cursor.execute(f"DELETE FROM {RETRY_QUEUE_TABLE} WHERE Wallet = ?", (Wallet,))
-            # Nothing else needed
-        elif tl_status is False or tl_status is None:
-            # If still no trustline or we still can't fetch, move to missing_tl
-            logging.info(f"[{Wallet}] No trustline found or still cannot fetch. Moving to missing_tl.")
-            cursor.execute(f"""
-                INSERT OR REPLACE INTO {MISSING_TL_TABLE} (Wallet, Balance)
-                VALUES (?, ?)
-            """, (Wallet, Balance))
-            cursor.execute(f"DELETE FROM {RETRY_QUEUE_TABLE} WHERE Wallet = ?", (Wallet,))
-            Wallets_moved_missing += 1
+    with readers.connection() as read_conn:
+        rows = read_conn.execute(f"SELECT Wallet, Balance FROM {RETRY_QUEUE_TABLE}")
+
+        for (Wallet, Balance, tl_status) in check_trustlines(rows, cache):
+            if tl_status is True:
+                # Now we see the trustline! Just remove from retry_queue.
+                logging.info("[%s] Found trustline on retry pass. Removing from retry_queue.", Wallet)
+                writer.submit((INSERT_CONFIRMED_SQL, (Wallet, ISSUER_OF_TOKEN, CURRENCY_HEX)), (delete_sql, (Wallet,)))
+            elif tl_status is False or tl_status is None:
+                # If still no trustline or we still can't fetch, move to missing_tl
+                logging.info("[%s] No trustline found or still cannot fetch. Moving to missing_tl.", Wallet)
+                writer.submit((INSERT_MISSING_SQL, (Wallet, Balance)), (delete_sql, (Wallet,)))
+                Wallets_moved_missing += 1
 
-    conn.commit()
+    writer.flush()
     return Wallets_moved_missing
 
 
@@ -231,23 +812,41 @@ def process_retry_queue(conn):
 # Main Script
 # ---------------------------------------------------------------------
 def main():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db(DB_PATH)
     ensure_tables(conn)
+    # One thread owns the writable connection; all reads go through a pool of
+    # read-only connections, which WAL lets run alongside the writer
+    writer = DBWriter(conn)
+    # One reader per worker (cache lookups) plus one for the streaming SELECT
+    # each pass holds open, so no thread ever waits for a connection
+    readers = ReaderPool(DB_PATH, CONCURRENCY + 1)
+
+    try:
+        # Cache account_lines answers against this run's validated ledger
+        ledger_index = fetch_validated_ledger_index()
+        if ledger_index is not None:
+            cache = TrustlineCache(readers, writer, ledger_index)
+            logging.info("Using validated ledger %d for the %s cache.", ledger_index, TL_CACHE_TABLE)
+        else:
+            cache = None
+            logging.warning("Could not get a validated ledger index; running without the %s cache.", TL_CACHE_TABLE)
+
+        # 1) First pass: process Wallets in the airdrop table
+        logging.info("=== First Pass: Checking Wallets in airdrop table ===")
+        moved_missing, moved_retry = process_Wallets_table(writer, readers, AIRDROP_TABLE, second_pass=False, cache=cache)
+        logging.info("First pass complete. Moved %d Wallets to missing_tl, %d Wallets to retry_queue.",
+                     moved_missing, moved_retry)
+
+        # 2) Second pass: Wallets in the retry_queue
+        if moved_retry > 0:
+            logging.info("=== Second Pass: Re-checking Wallets in retry_queue ===")
+            moved_missing_2 = process_retry_queue(writer, readers, cache=cache)
+            logging.info("Second pass complete. Moved %d Wallets to missing_tl.", moved_missing_2)
+    finally:
+        # 3) Cleanup: always let the writer commit what is still queued
+        readers.close()
+        writer.close()
 
-    # 1) First pass: process Wallets in the airdrop table
-    logging.info("=== First Pass: Checking Wallets in airdrop table ===")
-    moved_missing, moved_retry = process_Wallets_table(conn, AIRDROP_TABLE, second_pass=False)
-    logging.info(f"First pass complete. Moved {moved_missing} Wallets to missing_tl, "
-                 f"{moved_retry} Wallets to retry_queue.")
-
-    # 2) Second pass: Wallets in the retry_queue
-    if moved_retry > 0:
-        logging.info("=== Second Pass: Re-checking Wallets in retry_queue ===")
-        moved_missing_2 = process_retry_queue(conn)
-        logging.info(f"Second pass complete. Moved {moved_missing_2} Wallets to missing_tl.")
-
-    # 3) Cleanup / Summary
-    conn.close()
     logging.info("All done.")
 
 